@@ -45,6 +45,7 @@ class MADE(tf.keras.Model):
                hidden_order='left-to-right',
                activation=None,
                use_bias=True,
+               sparse_kernels=False,
                **kwargs):
     """Constructs network.
 
@@ -64,6 +65,10 @@ class MADE(tf.keras.Model):
         (up to a remainder term) to each degree.
       activation: Activation function.
       use_bias: Whether to use a bias.
+      sparse_kernels: Whether to store each masked kernel as a sparse tensor of
+        only its unmasked weights. This reduces the memory and compute of
+        forward passes when masks are sparse, e.g., for large input dimensions,
+        and the gradients and optimizer slots only cover the unmasked weights.
       **kwargs: Keyword arguments of parent class.
     """
     super(MADE, self).__init__(**kwargs)
@@ -73,7 +78,8 @@ class MADE(tf.keras.Model):
     self.hidden_order = hidden_order
     self.activation = tf.keras.activations.get(activation)
     self.use_bias = use_bias
-    self.network = tf.keras.Sequential([])
+    self.sparse_kernels = sparse_kernels
+    self.network = []
 
   def build(self, input_shape):
     input_shape = tf.TensorShape(input_shape)
@@ -91,51 +97,352 @@ class MADE(tf.keras.Model):
                          input_order=self.input_order,
                          hidden_order=self.hidden_order)
 
+    self.length = length
+    self.channels = channels
+
     # Input-to-hidden layer: [..., length, channels] -> [..., hidden_dims[0]].
-    self.network.add(tf.keras.layers.Reshape([length * channels]))
-    # Tile the mask so each element repeats contiguously; this is compatible
-    # with the autoregressive contraints unlike naive tiling.
+    # Inputs with all-zero rows feed no unit, so drop them from the kernel.
+    # Each mask row covers the channels of one input contiguously; this is
+    # compatible with the autoregressive contraints unlike naive tiling. The
+    # mask is not repeated, as the kernel broadcasts it over channels.
     mask = masks[0]
-    mask = tf.tile(mask[:, tf.newaxis, :], [1, channels, 1])
-    mask = tf.reshape(mask, [mask.shape[0] * channels, mask.shape[-1]])
+    input_positions = np.flatnonzero(mask.any(axis=1))
+    if not input_positions.size:
+      # Keep every input if none are connected, e.g., for length 1, so that
+      # kernels never have a zero-size dimension.
+      input_positions = np.arange(length)
+    mask = mask[input_positions]
+    input_indices = (input_positions[:, np.newaxis] * channels +
+                     np.arange(channels)).ravel()
+    # Convert index arrays to constants once here rather than on every call.
+    self.input_indices = None
+    if len(input_positions) < length:
+      self.input_indices = tf.constant(input_indices)
+    input_dim = len(input_indices)
     if self.hidden_dims:
-      layer = tf.keras.layers.Dense(
-          self.hidden_dims[0],
-          kernel_initializer=make_masked_initializer(mask),
-          kernel_constraint=make_masked_constraint(mask),
-          activation=self.activation,
-          use_bias=self.use_bias)
-      self.network.add(layer)
+      layer = self._make_masked_layer(input_dim,
+                                      self.hidden_dims[0],
+                                      mask,
+                                      activation=self.activation,
+                                      use_bias=self.use_bias)
+      self.network.append(layer)
+      input_dim = self.hidden_dims[0]
 
     # Hidden-to-hidden layers: [..., hidden_dims[l-1]] -> [..., hidden_dims[l]].
     for l in range(1, len(self.hidden_dims)):
-      layer = tf.keras.layers.Dense(
-          self.hidden_dims[l],
-          kernel_initializer=make_masked_initializer(masks[l]),
-          kernel_constraint=make_masked_constraint(masks[l]),
-          activation=self.activation,
-          use_bias=self.use_bias)
-      self.network.add(layer)
+      layer = self._make_masked_layer(input_dim,
+                                      self.hidden_dims[l],
+                                      masks[l],
+                                      activation=self.activation,
+                                      use_bias=self.use_bias)
+      self.network.append(layer)
+      input_dim = self.hidden_dims[l]
 
     # Hidden-to-output layer: [..., hidden_dims[-1]] -> [..., length, units].
-    # Tile the mask so each element repeats contiguously; this is compatible
-    # with the autoregressive contraints unlike naive tiling.
+    # Each mask column covers the units of one output contiguously; this is
+    # compatible with the autoregressive contraints unlike naive tiling. The
+    # mask is not repeated, as the kernel broadcasts it over units.
     if self.hidden_dims:
       mask = masks[-1]
-    mask = tf.tile(mask[..., tf.newaxis], [1, 1, self.units])
-    mask = tf.reshape(mask, [mask.shape[0], mask.shape[1] * self.units])
-    layer = tf.keras.layers.Dense(
-        length * self.units,
-        kernel_initializer=make_masked_initializer(mask),
-        kernel_constraint=make_masked_constraint(mask),
-        activation=None,
-        use_bias=self.use_bias)
-    self.network.add(layer)
-    self.network.add(tf.keras.layers.Reshape([length, self.units]))
+    # Outputs with all-zero columns receive no unit, so drop them from the
+    # kernel. They are scattered back as zeros, leaving only the bias.
+    output_positions = np.flatnonzero(mask.any(axis=0))
+    if not output_positions.size:
+      output_positions = np.arange(length)
+    mask = mask[:, output_positions]
+    output_indices = (output_positions[:, np.newaxis] * self.units +
+                      np.arange(self.units)).ravel()
+    self.output_indices = None
+    if len(output_positions) < length:
+      scatter_indices = np.full(length * self.units, len(output_indices))
+      scatter_indices[output_indices] = np.arange(len(output_indices))
+      self.output_indices = tf.constant(scatter_indices)
+    layer = self._make_masked_layer(input_dim,
+                                    len(output_indices),
+                                    mask,
+                                    activation=None,
+                                    use_bias=False)
+    self.network.append(layer)
+    if self.use_bias:
+      self.bias = self.add_weight(name='bias',
+                                  shape=[length * self.units],
+                                  initializer='zeros',
+                                  dtype=self.dtype,
+                                  trainable=True)
+    else:
+      self.bias = None
+    self.built = True
+
+  def call(self, inputs):
+    # Apply the masked layers in one pass over flattened inputs, so a traced or
+    # compiled graph sees the whole computation rather than nested models.
+    outputs = tf.reshape(inputs, [-1, self.length * self.channels])
+    if self.input_indices is not None:
+      outputs = tf.gather(outputs, self.input_indices, axis=1)
+    for layer in self.network:
+      outputs = layer(outputs)
+    if self.output_indices is not None:
+      outputs = tf.pad(outputs, [[0, 0], [0, 1]])
+      outputs = tf.gather(outputs, self.output_indices, axis=1)
+    if self.use_bias:
+      outputs = tf.nn.bias_add(outputs, self.bias)
+    batch_shape = tf.shape(inputs)[:-2]
+    outputs = tf.reshape(outputs,
+                         tf.concat([batch_shape, [self.length, self.units]], 0))
+    outputs.set_shape(inputs.shape[:-2].concatenate([self.length, self.units]))
+    return outputs
+
+  def quantize(self):
+    """Replaces the masked kernels with int8 kernels for inference.
+
+    Each masked kernel is quantized to int8 with a symmetric scale per output
+    unit, which quarters the memory used to store the kernels. This is
+    weight-only compression: the forward pass dequantizes each kernel to the
+    layer's dtype before a float matmul. Quantized layers are not trainable, so
+    call this once the weights are final.
+
+    Raises:
+      ValueError: If the network is not built or uses sparse kernels.
+    """
+    if not self.built:
+      raise ValueError('`MADE` must be built before it is quantized.')
+    if self.sparse_kernels:
+      raise ValueError('`MADE` with sparse kernels cannot be quantized.')
+    for l, layer in enumerate(self.network):
+      if isinstance(layer, QuantizedDense):
+        continue
+      kernel = tf.keras.backend.get_value(layer.dense_kernel())
+      bias = tf.keras.backend.get_value(layer.bias) if layer.use_bias else None
+      layer = QuantizedDense(kernel,
+                             bias=bias,
+                             activation=layer.activation,
+                             dtype=self._dtype_policy)
+      _build_layer(layer, kernel.shape[0])
+      self.network[l] = layer
+
+  def _make_masked_layer(self, input_dim, units, mask, activation, use_bias):
+    if self.sparse_kernels:
+      layer = SparseMaskedDense(units,
+                                mask=mask,
+                                activation=activation,
+                                use_bias=use_bias,
+                                dtype=self._dtype_policy)
+    else:
+      layer = MaskedDense(units,
+                          mask=tf.constant(mask, dtype=tf.bool),
+                          kernel_initializer=make_masked_initializer(mask),
+                          activation=activation,
+                          use_bias=use_bias,
+                          dtype=self._dtype_policy)
+    # Build here so that the weights of a built MADE exist, e.g., for quantize.
+    _build_layer(layer, input_dim)
+    return layer
+
+
+class MaskedDense(tf.keras.layers.Dense):
+  """Densely-connected layer whose kernel is zeroed outside a fixed binary mask.
+
+  The layer computes `activation(inputs @ (kernel * mask) + bias)` for inputs of
+  shape `[batch_size, input_dim]`. Masking inside the forward pass, rather than
+  with a kernel constraint, keeps the masked weights out of both the output and
+  the gradients without a separate projection after each optimizer step.
+
+  The kernel's gradient is still a dense Tensor with zeros at masked entries;
+  `tf.IndexedSlices` only represent whole rows, and rows with no unmasked
+  entries are already dropped by `MADE`. Use `SparseMaskedDense` to keep the
+  gradients and optimizer slots down to the unmasked weights.
+  """
+
+  def __init__(self, units, mask, **kwargs):
+    """Constructs layer.
+
+    Args:
+      units: Positive integer, dimensionality of the output space.
+      mask: Boolean Tensor of shape `[input_dim, units]`, or a block mask
+        whose dimensions divide them, where each entry covers a contiguous
+        block of kernel entries. See `apply_mask`.
+      **kwargs: Keyword arguments of parent class.
+    """
+    super(MaskedDense, self).__init__(units, **kwargs)
+    self.mask = mask
+
+  def dense_kernel(self):
+    """Returns the masked kernel as a Tensor of shape `[input_dim, units]`."""
+    return apply_mask(self.kernel, self.mask)
+
+  def call(self, inputs):
+    # Not `b_is_sparse=True`: it dispatches to SparseMatMul, which is slower
+    # than a dense matmul at the roughly half-dense masks of MADE and always
+    # returns float32.
+    outputs = tf.matmul(inputs, self.dense_kernel())
+    if self.use_bias:
+      outputs = tf.nn.bias_add(outputs, self.bias)
+    if self.activation is not None:
+      outputs = self.activation(outputs)
+    return outputs
+
+
+class QuantizedDense(tf.keras.layers.Layer):
+  """Densely-connected layer with a fixed int8 kernel for inference.
+
+  Each column of the kernel is quantized symmetrically to int8 with its own
+  scale, `kernel ~= kernel_int8 * scale`. The int8 kernel takes a quarter of
+  the memory of a float32 kernel. The forward pass dequantizes it to a float
+  kernel on every call, so it does not reduce the memory traffic of the matmul.
+  """
+
+  def __init__(self, kernel, bias=None, activation=None, **kwargs):
+    """Constructs layer.
+
+    Args:
+      kernel: NumPy array of shape `[input_dim, units]` to quantize.
+      bias: NumPy array of shape `[units]`, or None for no bias.
+      activation: Activation function.
+      **kwargs: Keyword arguments of parent class.
+    """
+    kwargs.setdefault('trainable', False)
+    super(QuantizedDense, self).__init__(**kwargs)
+    kernel = np.asarray(kernel)
+    scale = np.max(np.abs(kernel), axis=0) / 127.
+    scale = np.where(scale > 0., scale, 1.)
+    self.units = kernel.shape[-1]
+    self.kernel_values = np.round(kernel / scale).astype(np.int8)
+    self.kernel_scale_values = scale.astype(np.float32)
+    self.bias_values = bias
+    self.activation = tf.keras.activations.get(activation)
+
+  def build(self, input_shape):
+    self.kernel = self.add_weight(
+        name='kernel',
+        shape=self.kernel_values.shape,
+        initializer=tf.constant_initializer(self.kernel_values),
+        dtype=tf.int8,
+        trainable=False)
+    self.kernel_scale = self.add_weight(
+        name='kernel_scale',
+        shape=self.kernel_scale_values.shape,
+        initializer=tf.constant_initializer(self.kernel_scale_values),
+        dtype=self.dtype,
+        trainable=False)
+    if self.bias_values is not None:
+      self.bias = self.add_weight(
+          name='bias',
+          shape=self.bias_values.shape,
+          initializer=tf.constant_initializer(self.bias_values),
+          dtype=self.dtype,
+          trainable=False)
+    else:
+      self.bias = None
+    self.built = True
+
+  def dense_kernel(self):
+    """Returns the dequantized kernel of shape `[input_dim, units]`."""
+    # Read the scale first, which casts it to the compute dtype inside `call`.
+    kernel_scale = tf.convert_to_tensor(self.kernel_scale)
+    return tf.cast(self.kernel, kernel_scale.dtype) * kernel_scale
+
+  def call(self, inputs):
+    outputs = tf.matmul(inputs, self.dense_kernel())
+    if self.bias is not None:
+      outputs = tf.nn.bias_add(outputs, self.bias)
+    if self.activation is not None:
+      outputs = self.activation(outputs)
+    return outputs
+
+
+class SparseMaskedDense(tf.keras.layers.Layer):
+  """Densely-connected layer storing only the unmasked weights of its kernel.
+
+  The layer computes `activation(inputs @ kernel + bias)`, where `kernel` is a
+  sparse matrix of shape `[input_dim, units]` whose nonzero pattern is given by
+  a binary `mask`. Only the `num_nonzero` unmasked weights are trainable
+  variables, so masked entries cost neither memory nor compute.
+  """
+
+  def __init__(self,
+               units,
+               mask,
+               activation=None,
+               use_bias=True,
+               bias_initializer='zeros',
+               **kwargs):
+    """Constructs layer.
+
+    Args:
+      units: Positive integer, dimensionality of the output space.
+      mask: Binary NumPy array of shape `[input_dim, units]`, or a block mask
+        whose dimensions divide them, where each entry covers a contiguous
+        block of kernel entries. See `apply_mask`.
+      activation: Activation function.
+      use_bias: Whether to use a bias.
+      bias_initializer: Initializer for the bias vector.
+      **kwargs: Keyword arguments of parent class.
+    """
+    super(SparseMaskedDense, self).__init__(**kwargs)
+    self.units = int(units)
+    self.mask = np.asarray(mask) > 0
+    self.activation = tf.keras.activations.get(activation)
+    self.use_bias = use_bias
+    self.bias_initializer = tf.keras.initializers.get(bias_initializer)
+
+  def build(self, input_shape):
+    input_dim = tf.compat.dimension_value(tf.TensorShape(input_shape)[-1])
+    row_block = input_dim // self.mask.shape[0]
+    col_block = self.units // self.mask.shape[1]
+    # Expand each nonzero mask entry to its block of kernel entries with index
+    # arithmetic, without materializing the full mask.
+    rows, cols = np.nonzero(self.mask)
+    kernel_rows = (rows[:, np.newaxis, np.newaxis] * row_block +
+                   np.arange(row_block)[:, np.newaxis])
+    kernel_cols = (cols[:, np.newaxis, np.newaxis] * col_block +
+                   np.arange(col_block))
+    kernel_rows, kernel_cols = np.broadcast_arrays(kernel_rows, kernel_cols)
+    kernel_rows = kernel_rows.ravel()
+    kernel_cols = kernel_cols.ravel()
+    # Store the kernel transposed, [units, input_dim], so the forward pass is a
+    # single sparse-dense matmul. Indices are in canonical row-major order.
+    order = np.lexsort((kernel_rows, kernel_cols))
+    kernel_rows = kernel_rows[order]
+    kernel_cols = kernel_cols[order]
+    self.kernel_indices = tf.constant(
+        np.stack([kernel_cols, kernel_rows], axis=-1), dtype=tf.int64)
+    self.kernel_shape = tf.constant([self.units, input_dim], dtype=tf.int64)
+    # Glorot uniform initialization, where the fan-in and fan-out of each weight
+    # count only the unmasked connections of its input and output unit.
+    fan_in = np.maximum(self.mask.sum(axis=0) * row_block, 1)
+    fan_out = np.maximum(self.mask.sum(axis=1) * col_block, 1)
+    fan_in = fan_in[kernel_cols // col_block]
+    fan_out = fan_out[kernel_rows // row_block]
+    limit = np.sqrt(6. / (fan_in + fan_out))
+    def kernel_initializer(shape, dtype=None):
+      dtype = tf.as_dtype(dtype or tf.keras.backend.floatx())
+      return (tf.constant(limit, dtype=dtype) *
+              tf.random.uniform(shape, -1., 1., dtype=dtype))
+    self.kernel = self.add_weight(name='kernel',
+                                  shape=[len(kernel_rows)],
+                                  initializer=kernel_initializer,
+                                  dtype=self.dtype,
+                                  trainable=True)
+    if self.use_bias:
+      self.bias = self.add_weight(name='bias',
+                                  shape=[self.units],
+                                  initializer=self.bias_initializer,
+                                  dtype=self.dtype,
+                                  trainable=True)
+    else:
+      self.bias = None
     self.built = True
 
   def call(self, inputs):
-    return self.network(inputs)
+    kernel = tf.SparseTensor(self.kernel_indices, self.kernel,
+                             self.kernel_shape)
+    outputs = tf.sparse.sparse_dense_matmul(kernel, inputs, adjoint_b=True)
+    outputs = tf.transpose(outputs)
+    if self.use_bias:
+      outputs = tf.nn.bias_add(outputs, self.bias)
+    if self.activation is not None:
+      outputs = self.activation(outputs)
+    return outputs
 
 
 def create_degrees(input_dim,
@@ -180,15 +487,20 @@ def create_degrees(input_dim,
     input_degrees = input_order
   degrees.append(input_degrees)
 
-  for units in hidden_dims:
-    if hidden_order == 'random':
+  if hidden_order == 'random':
+    # Each layer's lowest degree bounds the next layer's, so draw sequentially.
+    for units in hidden_dims:
       min_prev_degree = min(np.min(degrees[-1]), input_dim - 1)
       hidden_degrees = np.random.randint(
           low=min_prev_degree, high=input_dim, size=units)
-    elif hidden_order == 'left-to-right':
-      hidden_degrees = (np.arange(units) % max(1, input_dim - 1) +
-                        min(1, input_dim - 1))
-    degrees.append(hidden_degrees)
+      degrees.append(hidden_degrees)
+  elif hidden_order == 'left-to-right':
+    # Each layer's degrees are a prefix of the same cyclic sequence, so compute
+    # it once for the widest layer and slice.
+    max_units = max(hidden_dims) if hidden_dims else 0
+    hidden_degrees = (np.arange(max_units) % max(1, input_dim - 1) +
+                      min(1, input_dim - 1))
+    degrees.extend(hidden_degrees[:units] for units in hidden_dims)
   return degrees
 
 
@@ -211,29 +523,108 @@ def create_masks(input_dim,
     hidden_order: Order of degrees to the hidden units: 'random',
       'left-to-right'. If 'left-to-right', hidden units are allocated equally
       (up to a remainder term) to each degree.
+
+  Returns:
+    List of boolean NumPy arrays, one for each layer's kernel. The
+    masks are constants, so they are not built as TensorFlow ops. Masks for
+    non-random orders are cached and shared across calls, so they are
+    read-only.
   """
+  if hidden_order == 'random' or (isinstance(input_order, str) and
+                                  input_order == 'random'):
+    # Random orders draw from NumPy's global random state on every call.
+    return _create_masks(input_dim, hidden_dims, input_order, hidden_order)
+  if not isinstance(input_order, str):
+    input_order = tuple(np.asarray(input_order).tolist())
+  key = (input_dim, tuple(hidden_dims), input_order, hidden_order)
+  masks = _MASKS_CACHE.get(key)
+  if masks is None:
+    masks = tuple(_create_masks(input_dim, hidden_dims, input_order,
+                                hidden_order))
+    for mask in masks:
+      mask.setflags(write=False)
+    if len(_MASKS_CACHE) >= _MASKS_CACHE_SIZE:
+      _MASKS_CACHE.clear()
+    _MASKS_CACHE[key] = masks
+  return list(masks)
+
+
+_MASKS_CACHE = {}
+_MASKS_CACHE_SIZE = 128
+
+
+def _create_masks(input_dim, hidden_dims, input_order, hidden_order):
+  """Returns a list of binary mask matrices without caching."""
   degrees = create_degrees(input_dim, hidden_dims, input_order, hidden_order)
   masks = []
   # Create input-to-hidden and hidden-to-hidden masks.
   for input_degrees, output_degrees in zip(degrees[:-1], degrees[1:]):
-    mask = tf.cast(input_degrees[:, np.newaxis] <= output_degrees, tf.float32)
+    mask = input_degrees[:, np.newaxis] <= output_degrees
     masks.append(mask)
 
   # Create hidden-to-output mask.
-  mask = tf.cast(degrees[-1][:, np.newaxis] < degrees[0], tf.float32)
+  mask = degrees[-1][:, np.newaxis] < degrees[0]
   masks.append(mask)
   return masks
 
 
 def make_masked_initializer(mask):
-  initializer = tf.keras.initializers.GlorotUniform()
+  """Returns a Glorot uniform initializer for kernels under a fixed mask.
+
+  The initial values are sampled and masked in NumPy, so the variable is created
+  from a constant rather than from random and masking ops. The fan-in and
+  fan-out of each weight count only the unmasked connections of its input and
+  output unit.
+
+  Args:
+    mask: Binary NumPy array of shape `[mask_rows, mask_cols]`. See
+      `apply_mask`.
+
+  Returns:
+    Initializer taking a kernel shape `[input_dim, units]` and dtype.
+  """
+  mask = np.asarray(mask) > 0
   def masked_initializer(shape, dtype=None):
-    return mask * initializer(shape, dtype)
+    dtype = tf.as_dtype(dtype or tf.keras.backend.floatx())
+    input_dim, units = [tf.compat.dimension_value(dim) for dim in shape]
+    row_block = input_dim // mask.shape[0]
+    col_block = units // mask.shape[1]
+    kernel_mask = np.kron(mask, np.ones([row_block, col_block], dtype=bool))
+    fan_in = np.maximum(kernel_mask.sum(axis=0), 1)
+    fan_out = np.maximum(kernel_mask.sum(axis=1, keepdims=True), 1)
+    limit = np.sqrt(6. / (fan_in + fan_out))
+    values = np.random.uniform(-limit, limit) * kernel_mask
+    return tf.constant(values, dtype=dtype)
   return masked_initializer
 
 
-def make_masked_constraint(mask):
-  constraint = tf.identity
-  def masked_constraint(x):
-    return mask * constraint(x)
-  return masked_constraint
+def apply_mask(kernel, mask):
+  """Zeros out entries of a kernel outside a boolean mask.
+
+  Args:
+    kernel: Tensor of shape `[input_dim, units]`.
+    mask: Boolean Tensor of shape `[mask_rows, mask_cols]`, where `mask_rows`
+      divides `input_dim` and `mask_cols` divides `units`. Each mask entry
+      covers a contiguous block of `input_dim // mask_rows` rows and
+      `units // mask_cols` columns of the kernel.
+
+  Returns:
+    Tensor of the same shape and dtype as `kernel`.
+  """
+  input_dim, units = [tf.compat.dimension_value(dim) for dim in kernel.shape]
+  mask_rows, mask_cols = [tf.compat.dimension_value(dim) for dim in mask.shape]
+  # Select against a broadcast scalar zero, which avoids a kernel-sized zeros
+  # tensor.
+  zero = tf.zeros([], dtype=kernel.dtype)
+  if mask_rows == input_dim and mask_cols == units:
+    return tf.where(mask, kernel, zero)
+  kernel = tf.reshape(kernel, [mask_rows, input_dim // mask_rows,
+                               mask_cols, units // mask_cols])
+  mask = mask[:, tf.newaxis, :, tf.newaxis]
+  kernel = tf.where(mask, kernel, zero)
+  return tf.reshape(kernel, [input_dim, units])
+
+
+def _build_layer(layer, input_dim):
+  with tf.name_scope(layer.name):
+    layer.build(tf.TensorShape([None, input_dim]))
@@ -19,7 +19,11 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import itertools
+
+from absl.testing import parameterized
 import edward2 as ed
+from edward2.tensorflow.layers import made
 import numpy as np
 import tensorflow.compat.v1 as tf1
 import tensorflow.compat.v2 as tf
@@ -28,7 +32,7 @@ from tensorflow.python.framework import test_util  # pylint: disable=g-direct-te
 
 
 @test_util.run_all_in_graph_and_eager_modes
-class MADETest(tf.test.TestCase):
+class MADETest(parameterized.TestCase, tf.test.TestCase):
 
   def testMADELeftToRight(self):
     np.random.seed(83243)
@@ -44,7 +48,9 @@ class MADETest(tf.test.TestCase):
     # Disable lint error for open-source. pylint: disable=g-generic-assert
     self.assertEqual(len(network.weights), 4)
     # pylint: enable=g-generic-assert
-    self.assertEqual(num_weights, (3*1*4 + 4) + (4*3*5 + 3*5))
+    # The last input and the first output have no connections, so they are
+    # dropped from the kernels.
+    self.assertEqual(num_weights, (2*1*4 + 4) + (4*2*5 + 3*5))
 
     self.evaluate(tf1.global_variables_initializer())
     outputs_val = self.evaluate(outputs)
@@ -68,7 +74,7 @@ class MADETest(tf.test.TestCase):
     # Disable lint error for open-source. pylint: disable=g-generic-assert
     self.assertEqual(len(network.weights), 3)
     # pylint: enable=g-generic-assert
-    self.assertEqual(num_weights, 3*5*4 + 4*3 + 3*3*1)
+    self.assertEqual(num_weights, 2*5*4 + 4*3 + 3*2*1)
 
     self.evaluate(tf1.global_variables_initializer())
     outputs_val = self.evaluate(outputs)
@@ -89,13 +95,240 @@ class MADETest(tf.test.TestCase):
     # Disable lint error for open-source. pylint: disable=g-generic-assert
     self.assertEqual(len(network.weights), 2)
     # pylint: enable=g-generic-assert
-    self.assertEqual(num_weights, 3*5*3*4 + 3*4)
+    self.assertEqual(num_weights, 2*5*2*4 + 3*4)
 
     self.evaluate(tf1.global_variables_initializer())
     outputs_val = self.evaluate(outputs)
     self.assertAllEqual(outputs_val[:, 0, :], np.zeros((batch_size, units)))
     self.assertEqual(outputs_val.shape, (batch_size, length, units))
 
+  def testMADESparseKernels(self):
+    np.random.seed(83243)
+    batch_size = 2
+    length = 3
+    channels = 1
+    units = 5
+    network = ed.layers.MADE(units, [4],
+                             activation=tf.nn.relu,
+                             sparse_kernels=True)
+    inputs = tf.zeros([batch_size, length, channels])
+    outputs = network(inputs)
+
+    num_weights = sum([np.prod(weight.shape) for weight in network.weights])
+    # Disable lint error for open-source. pylint: disable=g-generic-assert
+    self.assertEqual(len(network.weights), 4)
+    # pylint: enable=g-generic-assert
+    # Only unmasked weights are stored: input degrees are [1, 2, 3] and hidden
+    # degrees are [1, 2, 1, 2].
+    self.assertEqual(num_weights, (6 + 4) + (6*5 + 3*5))
+
+    self.evaluate(tf1.global_variables_initializer())
+    outputs_val = self.evaluate(outputs)
+    self.assertAllEqual(outputs_val[:, 0, :], np.zeros((batch_size, units)))
+    self.assertEqual(outputs_val.shape, (batch_size, length, units))
+
+  @parameterized.parameters(
+      {'dtype': 'float32'},
+      {'dtype': 'float64'},
+  )
+  def testSparseMaskedDense(self, dtype):
+    np.random.seed(3321)
+    mask = np.array([[1, 0], [1, 1], [0, 1]], dtype=bool)
+    layer = made.SparseMaskedDense(4, mask=mask,
+                                   bias_initializer='random_normal',
+                                   dtype=dtype)
+    inputs = np.random.normal(size=(5, 6)).astype(dtype)
+    outputs = layer(tf.constant(inputs))
+    kernel = tf.sparse.to_dense(tf.SparseTensor(layer.kernel_indices,
+                                                layer.kernel,
+                                                layer.kernel_shape))
+    self.evaluate(tf1.global_variables_initializer())
+    outputs_val, kernel_val, bias_val = self.evaluate(
+        [outputs, tf.transpose(kernel), layer.bias])
+    # Each mask entry covers a 2x2 block of kernel entries.
+    kernel_mask = np.kron(mask, np.ones([2, 2], dtype=bool))
+    self.assertEqual(outputs_val.dtype, dtype)
+    self.assertAllEqual(kernel_val != 0., kernel_mask)
+    self.assertAllClose(outputs_val, np.dot(inputs, kernel_val) + bias_val)
+
+  def testMADESparseKernelsGradients(self):
+    network = ed.layers.MADE(3, [4], sparse_kernels=True)
+    inputs = tf.random.normal([2, 3, 1])
+    with tf.GradientTape() as tape:
+      outputs = network(inputs)
+      loss = tf.reduce_sum(outputs)
+    grads = tape.gradient(loss, network.trainable_variables)
+    # Kernel gradients have one entry per unmasked weight.
+    for grad, weight in zip(grads, network.trainable_variables):
+      self.assertEqual(grad.shape, weight.shape)
+    self.assertEqual(grads[0].shape, [6])
+
+  @parameterized.parameters(
+      itertools.product([[], [8, 8]],
+                        ['left-to-right', 'right-to-left', [2, 4, 1, 3],
+                         'random'],
+                        [False, True]))
+  def testMADEAutoregressive(self, hidden_dims, input_order, sparse_kernels):
+    np.random.seed(1234)
+    length = 4
+    channels = 2
+    units = 3
+    network = ed.layers.MADE(units, hidden_dims,
+                             input_order=input_order,
+                             activation=tf.nn.tanh,
+                             sparse_kernels=sparse_kernels)
+    # Perturb each input position in turn, keeping the unperturbed inputs as
+    # the first batch member.
+    inputs = np.random.normal(size=(length, channels)).astype(np.float32)
+    perturbed_inputs = np.tile(inputs, [length + 1, 1, 1])
+    perturbed_inputs[np.arange(1, length + 1), np.arange(length)] += 1.
+    outputs = network(tf.constant(perturbed_inputs))
+    self.evaluate(tf1.global_variables_initializer())
+    outputs_val = self.evaluate(outputs)
+
+    # depends[i, j] is whether output j changes with input i.
+    diffs = np.abs(outputs_val[1:] - outputs_val[:1]).max(axis=-1)
+    depends = diffs > 1e-6
+    # Outputs must depend on exactly the inputs preceding them in one order.
+    degrees = depends.sum(axis=0) + 1
+    self.assertAllEqual(np.sort(degrees), np.arange(1, length + 1))
+    self.assertAllEqual(depends, degrees[:, np.newaxis] < degrees)
+    if input_order == 'left-to-right':
+      self.assertAllEqual(degrees, np.arange(1, length + 1))
+    elif input_order == 'right-to-left':
+      self.assertAllEqual(degrees, np.arange(length, 0, -1))
+    elif input_order != 'random':
+      self.assertAllEqual(degrees, input_order)
+
+  @parameterized.parameters(
+      {'hidden_dims': [], 'sparse_kernels': False},
+      {'hidden_dims': [], 'sparse_kernels': True},
+      {'hidden_dims': [4], 'sparse_kernels': False},
+      {'hidden_dims': [4], 'sparse_kernels': True},
+  )
+  def testMADELengthOne(self, hidden_dims, sparse_kernels):
+    batch_size = 2
+    channels = 3
+    units = 5
+    network = ed.layers.MADE(units, hidden_dims,
+                             activation=tf.nn.relu,
+                             sparse_kernels=sparse_kernels)
+    inputs = tf.random.normal([batch_size, 1, channels])
+    outputs = network(inputs)
+    self.evaluate(tf1.global_variables_initializer())
+    outputs_val = self.evaluate(outputs)
+    # The only output has no parents, so it is constant.
+    self.assertAllEqual(outputs_val, np.zeros((batch_size, 1, units)))
+
+  @parameterized.parameters(
+      itertools.product([[], [4]], [False, True]))
+  def testMADEFloat64(self, hidden_dims, sparse_kernels):
+    network = ed.layers.MADE(3, hidden_dims,
+                             activation=tf.nn.relu,
+                             sparse_kernels=sparse_kernels,
+                             dtype='float64')
+    inputs = tf.random.normal([2, 4, 2], dtype=tf.float64)
+    outputs = network(inputs)
+    self.assertEqual(outputs.dtype, tf.float64)
+    for weight in network.weights:
+      self.assertEqual(weight.dtype, tf.float64)
+    if not sparse_kernels:
+      network.quantize()
+      self.assertEqual(network(inputs).dtype, tf.float64)
+
+  @parameterized.parameters(False, True)
+  def testMADEMixedPrecision(self, sparse_kernels):
+    policy = tf.keras.mixed_precision.Policy('mixed_float16')
+    network = ed.layers.MADE(3, [4],
+                             activation=tf.nn.relu,
+                             sparse_kernels=sparse_kernels,
+                             dtype=policy)
+    inputs = tf.random.normal([2, 4, 2])
+    outputs = network(inputs)
+    self.assertEqual(outputs.dtype, tf.float16)
+    for weight in network.trainable_weights:
+      self.assertEqual(weight.dtype, tf.float32)
+    if not sparse_kernels:
+      network.quantize()
+      self.assertEqual(network(inputs).dtype, tf.float16)
+
+  def testMADEBatchShape(self):
+    np.random.seed(2911)
+    length = 3
+    channels = 2
+    units = 4
+    network = ed.layers.MADE(units, [6, 5], activation=tf.nn.relu)
+    inputs = np.random.normal(size=(5, 2, length, channels)).astype(np.float32)
+    outputs = network(tf.constant(inputs))
+    flat_outputs = network(tf.reshape(inputs, [10, length, channels]))
+    self.assertEqual(outputs.shape, (5, 2, length, units))
+
+    self.evaluate(tf1.global_variables_initializer())
+    outputs_val, flat_outputs_val = self.evaluate([outputs, flat_outputs])
+    self.assertAllClose(outputs_val.reshape(flat_outputs_val.shape),
+                        flat_outputs_val)
+
+    # Compare to matmuls over flattened inputs. The last input has no
+    # dependents and the first output has no parents, so the kernels drop them.
+    kernels = self.evaluate([layer.dense_kernel() for layer in network.network])
+    biases = self.evaluate([layer.bias for layer in network.network[:-1]])
+    expected = inputs[..., :-1, :].reshape([10, -1])
+    for kernel, bias in zip(kernels[:-1], biases):
+      expected = np.maximum(np.dot(expected, kernel) + bias, 0.)
+    expected = np.dot(expected, kernels[-1]).reshape([5, 2, length - 1, units])
+    expected = np.concatenate([np.zeros([5, 2, 1, units]), expected], axis=-2)
+    expected += self.evaluate(network.bias).reshape([length, units])
+    self.assertAllClose(outputs_val, expected, rtol=1e-5, atol=1e-5)
+
+  def testMADEQuantize(self):
+    np.random.seed(5413)
+    batch_size = 2
+    length = 3
+    channels = 2
+    units = 4
+    network = ed.layers.MADE(units, [8, 8], activation=tf.nn.relu)
+    inputs = tf.constant(
+        np.random.normal(size=(batch_size, length, channels)), tf.float32)
+    outputs = network(inputs)
+    self.evaluate(tf1.global_variables_initializer())
+    outputs_val = self.evaluate(outputs)
+
+    network.quantize()
+    quantized_outputs = network(inputs)
+    self.evaluate(tf1.global_variables_initializer())
+    quantized_outputs_val = self.evaluate(quantized_outputs)
+    kernel_dtypes = [layer.kernel.dtype for layer in network.network]
+    self.assertAllEqual(kernel_dtypes, [tf.int8] * 3)
+    self.assertAllEqual(quantized_outputs_val[:, 0, :],
+                        np.zeros((batch_size, units)))
+    self.assertAllClose(quantized_outputs_val, outputs_val, atol=0.05)
+
+  def testCreateMasksCached(self):
+    masks = made.create_masks(3, [4, 4], input_order=[2, 3, 1])
+    masks_ = made.create_masks(3, (4, 4), input_order=[2, 3, 1])
+    for mask, mask_ in zip(masks, masks_):
+      self.assertIs(mask, mask_)
+      self.assertFalse(mask.flags.writeable)
+
+    np.random.seed(42)
+    masks = made.create_masks(3, [4, 4], hidden_order='random')
+    masks_ = made.create_masks(3, [4, 4], hidden_order='random')
+    for mask, mask_ in zip(masks, masks_):
+      self.assertIsNot(mask, mask_)
+
+  def testMakeMaskedInitializer(self):
+    np.random.seed(5)
+    mask = np.array([[1, 0], [1, 1]], dtype=bool)
+    initializer = made.make_masked_initializer(mask)
+    kernel = self.evaluate(initializer([4, 6], tf.float32))
+    self.assertEqual(kernel.dtype, np.float32)
+    # Each mask entry covers a 2x3 block of kernel entries.
+    self.assertAllEqual(kernel[:2, 3:], np.zeros((2, 3)))
+    self.assertTrue(np.all(kernel[:2, :3] != 0.))
+    # The first input units connect to 3 outputs and the first output units
+    # connect to 4 inputs.
+    self.assertAllLessEqual(np.abs(kernel[:2, :3]), np.sqrt(6. / (4 + 3)))
+
 
 if __name__ == '__main__':
   tf.test.main()